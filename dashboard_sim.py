@@ -1,4 +1,8 @@
-from itertools import islice
+import inspect
+import io
+import os
+from functools import lru_cache, wraps
+import numpy as np
 import pandas as pd
 import dash
 from dash import dcc
@@ -55,6 +59,39 @@ style_message_shown = {
 
 style_message_hidden = {"display": "none"}
 
+# Maximum number of points of each trace in the response time plot
+max_trace_points = 5000
+
+# Types of the columns of the summary and utilizations files, so that pandas
+# does not have to infer them
+summary_dtypes = {"key": str, "value": str}
+utils_dtypes = {"vm_name": "category", "ic": "category", "util": "float64"}
+
+# Columns of the requests file read as categoricals, so that grouping by them
+# works with integer codes instead of strings
+reqs_categories = ("app", "vm", "ic")
+
+# Columns of the requests file used in the gantt charts
+gantt_cols = ("req", "creation", "start", "end", "app", "vm")
+
+# Minimum height and separation in pixels of each facet in the gantt chart
+gantt_min_facet_height = 100
+gantt_facet_gap = 40
+
+# Each line of the events file has the time, the event type and up to three
+# fields whose meaning depends on the event type
+events_fields = ("time", "ev", "f2", "f3", "f4")
+events_cols = ("req", "app", "vm", "ic", "price")
+events_fields_per_type = {
+    EvType.VM_START: {"vm": "f2", "ic": "f3", "price": "f4"},
+    EvType.VM_END: {"vm": "f2"},
+    EvType.VM_ASSIGN_APP: {"vm": "f2", "app": "f3"},
+    EvType.REQ_CREATION: {"req": "f2", "app": "f3"},
+    EvType.REQ_START: {"req": "f2", "vm": "f3", "app": "f4"},
+    EvType.REQ_END: {"req": "f2"},
+}
+event_names = {event.value: event.name for event in EvType}
+
 app.layout = html.Div(
     children=[
         html.H1(children="Requests"),
@@ -327,6 +364,20 @@ tab_events = html.Div(
     ]
 )
 
+tabs = {
+    "tab-summary": tab_summary,
+    "tab-gantt": tab_gantt,
+    "tab-detail": tab_detail,
+    "tab-util": tab_util,
+    "tab-events": tab_events,
+}
+
+# Tabs that use the first and last request
+tabs_with_req_selector = ("tab-gantt", "tab-detail")
+
+style_req_selector_shown = {"visibility": "visible"}
+style_req_selector_hidden = {"visibility": "hidden"}
+
 
 @app.callback(
     Output("tabs-content", "children"),
@@ -334,18 +385,10 @@ tab_events = html.Div(
     Input("tabs", "value"),
 )
 def render_content(tab):
-    tabs = {
-        "tab-summary": tab_summary,
-        "tab-gantt": tab_gantt,
-        "tab-detail": tab_detail,
-        "tab-util": tab_util,
-        "tab-events": tab_events,
-    }
-
-    if tab in ["tab-gantt", "tab-detail"]:
-        style = {"visibility": "visible"}
+    if tab in tabs_with_req_selector:
+        style = style_req_selector_shown
     else:
-        style = {"visibility": "hidden"}
+        style = style_req_selector_hidden
 
     return tabs[tab], style
 
@@ -452,42 +495,169 @@ def update_detail_table_and_plot(
     try:
         first_req = int(first_req)
         last_req = int(last_req)
+        aggregations = tuple(aggregations or ())
 
-        df_req = get_df_with_times(base_dir, prefix, first_req, last_req)
-
-        df_table = df_req
-        if aggregations:
-            df_table = (
-                df_table.groupby(aggregations)
-                .agg({"req": "count", "resp_time": agg_type, "serv_time": "mean"})
-                .reset_index()
-            )
-
-        data = df_table.to_dict("records")
-        cols = dash_cols(df_table)
+        data, cols = get_detail(
+            base_dir, prefix, first_req, last_req, aggregations, agg_type
+        )[2:]
     except Exception as e:
         print("Error in update_detail_table_and_plot while aggregating:", e)
         return data, cols, children
 
     if plot:
         try:
-            children = get_resp_time_plot(df_req, df_table, aggregations, agg_type)
+            children = get_detail_plot(
+                base_dir, prefix, first_req, last_req, aggregations, agg_type
+            )
         except Exception as e:
             print("Error in update_detail_table_and_plot while plotting:", e)
 
     return data, cols, children
 
 
+def memoize_while_unmodified(*suffixes):
+    """Decorator that keeps the last results of a function that receives the
+    arguments base_dir and prefix. A result is reused while the files
+    {base_dir}/{prefix}{suffix} are not modified, so it must not be changed in
+    place."""
+
+    def decorator(fun):
+        signature = inspect.signature(fun)
+
+        @lru_cache(maxsize=16)
+        def cached(mtimes, *args):
+            return fun(*args)
+
+        @wraps(fun)
+        def wrapper(*args):
+            arguments = signature.bind(*args).arguments
+            files = (
+                f"{arguments['base_dir']}/{arguments['prefix']}{s}" for s in suffixes
+            )
+            return cached(tuple(os.path.getmtime(f) for f in files), *args)
+
+        return wrapper
+
+    return decorator
+
+
+@memoize_while_unmodified("_reqs.csv")
+def get_detail(base_dir, prefix, first_req, last_req, aggregations, agg_type):
+    df_req = get_df_with_times(base_dir, prefix, first_req, last_req)
+
+    df_table = df_req
+    if aggregations:
+        df_table = (
+            df_table.groupby(list(aggregations), observed=True)
+            .agg({"req": "count", "resp_time": agg_type, "serv_time": "mean"})
+            .reset_index()
+        )
+
+    return df_req, df_table, dash_records(df_table), dash_cols(df_table)
+
+
+@memoize_while_unmodified("_reqs.csv")
+def get_detail_plot(base_dir, prefix, first_req, last_req, aggregations, agg_type):
+    df_req, df_table = get_detail(
+        base_dir, prefix, first_req, last_req, aggregations, agg_type
+    )[:2]
+    return get_resp_time_plot(df_req, df_table.copy(), list(aggregations), agg_type)
+
+
 def dash_cols(df):
     return [{"name": i, "id": i} for i in df.columns]
 
 
-def get_summary(base_dir, prefix):
-    df = pd.read_csv(
-        f"{base_dir}/{prefix}.csv", names=["key", "value"], header=0, index_col=0
-    ).T
+def dash_records(df):
+    """Equivalent to df.to_dict("records"), but faster because each column is
+    converted to Python objects at once with tolist()."""
+    cols = list(df.columns)
+    return [dict(zip(cols, row)) for row in zip(*(df[c].tolist() for c in cols))]
+
+
+def read_csv_cached(path, **kwargs):
+    """Returns the DataFrame parsed by pd.read_csv(path, **kwargs). The result
+    is kept in memory and reused until the file is modified, so callers must
+    not change it in place."""
+    if "dtype" in kwargs:  # Dictionaries cannot be used as keys in the cache
+        kwargs["dtype"] = tuple(kwargs["dtype"].items())
+    return _read_csv(path, os.path.getmtime(path), tuple(sorted(kwargs.items())))
+
+
+@lru_cache(maxsize=8)
+def _read_csv(path, mtime, kwargs):
+    kwargs = dict(kwargs)
+    if "dtype" in kwargs:
+        kwargs["dtype"] = dict(kwargs["dtype"])
+    return pd.read_csv(path, **kwargs)
+
+
+def read_reqs(path, first_req, last_req, usecols=None):
+    """Returns the requests of the requests file with numbers between first_req
+    and last_req (both included). The whole file is read and sorted by request
+    number only once, so any range is obtained with a binary search. If all the
+    columns are read, resp_time and serv_time are added. As in
+    read_csv_cached(), the result is shared, so callers must not change it in
+    place."""
+    df = _read_reqs(path, os.path.getmtime(path), usecols)
+    start, end = np.searchsorted(df.req.values, [first_req, last_req + 1])
+    return df.iloc[start:end]
+
+
+@lru_cache(maxsize=4)
+def _read_reqs(path, mtime, usecols):
+    df = pd.read_csv(path, usecols=usecols)
+    df = df.sort_values("req", kind="stable", ignore_index=True)
 
-    req_df = df[
+    for col in reqs_categories:
+        if col in df:
+            df[col] = df[col].astype("category")
+
+    if usecols is None:
+        # Computed once here instead of in each callback
+        end = df.end.values
+        df["resp_time"] = end - df.creation.values
+        df["serv_time"] = end - df.start.values
+
+    return df
+
+
+def read_lines(path, first, count):
+    """Returns a file object with count lines of the file, starting at line
+    first. The offset of each line is computed the first time the file is read,
+    so any page is read without going through the previous lines."""
+    offsets = _line_offsets(path, os.path.getmtime(path))
+    first = min(first, len(offsets) - 1)
+    last = min(first + count, len(offsets) - 1)
+    with open(path, "rb") as f:
+        f.seek(offsets[first])
+        return io.BytesIO(f.read(offsets[last] - offsets[first]))
+
+
+@lru_cache(maxsize=8)
+def _line_offsets(path, mtime):
+    with open(path, "rb") as f:
+        data = np.frombuffer(f.read(), dtype=np.uint8)
+
+    offsets = [[0], np.flatnonzero(data == ord("\n")) + 1]
+    if len(data) > 0 and data[-1] != ord("\n"):
+        offsets.append([len(data)])  # Last line without end of line
+    return np.concatenate(offsets)
+
+
+@memoize_while_unmodified(".csv")
+def get_summary(base_dir, prefix):
+    # Series where the index is the name of each value
+    summary = read_csv_cached(
+        f"{base_dir}/{prefix}.csv",
+        names=("key", "value"),
+        header=0,
+        index_col=0,
+        dtype=summary_dtypes,
+        engine="c",
+    ).value
+
+    req_df = summary[
         [
             "req_injected",
             "req_proc",
@@ -497,45 +667,45 @@ def get_summary(base_dir, prefix):
             "max_resp_time",
             "min_resp_time",
         ]
-    ].T.reset_index()
+    ].reset_index()
 
-    sim_df = df[["cost", "util", "sim_time", "stats_time"]].T.reset_index()
+    sim_df = summary[["cost", "util", "sim_time", "stats_time"]].reset_index()
 
-    sol_df = df[
+    sol_df = summary[
         ["sol_file", "workload", "workload_period", "workload_length"]
-    ].T.reset_index()
+    ].reset_index()
 
-    res_data = req_df.to_dict("records")
-    sim_data = sim_df.to_dict("records")
-    sol_data = sol_df.to_dict("records")
+    res_data = dash_records(req_df)
+    sim_data = dash_records(sim_df)
+    sol_data = dash_records(sol_df)
 
     res_cols = dash_cols(req_df)
     sim_cols = dash_cols(sim_df)
     sol_cols = dash_cols(sol_df)
 
-    req_info_df = df[
+    req_info_df = summary[
         ["req_injected", "req_proc", "req_pending", "req_lost"]
-    ].T.reset_index()
+    ].reset_index()
     req_info_df.value = req_info_df.value.astype("int")
     fig_req = px.bar(req_info_df, x="key", y="value")
     fig_req.update_yaxes(title="Number of requests")
     fig_req.update_xaxes(title="")
 
-    resp_time_df = df[
+    resp_time_df = summary[
         [
             "min_resp_time",
             "avg_resp_time",
             "max_resp_time",
         ]
-    ].T.reset_index()
+    ].reset_index()
     fig_resp_time = px.bar(resp_time_df, x="key", y="value", color="key")
     fig_resp_time.update_layout(showlegend=False)
     fig_resp_time.update_yaxes(title="Response time (s)")
     fig_resp_time.update_xaxes(title="")
 
-    cost = f"{float(df.cost):.2f}"
-    wl_period_s = float(df["workload_period"].astype(float))
-    wl_length_periods = float(df["workload_length"].astype(float))
+    cost = f"{float(summary['cost']):.2f}"
+    wl_period_s = float(summary["workload_period"])
+    wl_length_periods = float(summary["workload_length"])
     wl_length_h = f"{wl_period_s * wl_length_periods / 3600:.2f}"
 
     return (
@@ -553,14 +723,22 @@ def get_summary(base_dir, prefix):
 
 
 def get_df_with_times(base_dir, prefix, first_req, last_req):
-    df_req = pd.read_csv(f"{base_dir}/{prefix}_reqs.csv", nrows=last_req)
+    """Returns the requests in the range with the columns of the requests file
+    and their response and service times. The result must not be changed in
+    place."""
+    return read_reqs(f"{base_dir}/{prefix}_reqs.csv", first_req, last_req)
 
-    df_req = df_req[(df_req.req >= first_req) & (df_req.req <= last_req)]
 
-    df_req["resp_time"] = df_req.end - df_req.creation
-    df_req["serv_time"] = df_req.end - df_req.start
+def downsample(g, agg_type):
+    """Receives a DataFrame with the columns creation and resp_time, sorted by
+    creation. If it has more than max_trace_points rows, consecutive rows are
+    grouped in max_trace_points buckets, aggregating resp_time with agg_type,
+    so that the browser does not have to receive and draw all the points."""
+    if len(g) <= max_trace_points:
+        return g
 
-    return df_req
+    buckets = np.arange(len(g)) * max_trace_points // len(g)
+    return g.groupby(buckets).agg({"creation": "first", "resp_time": agg_type})
 
 
 def get_resp_time_plot(req_df, df_table, aggregations, agg_type):
@@ -569,16 +747,17 @@ def get_resp_time_plot(req_df, df_table, aggregations, agg_type):
 
         fig = go.Figure()
 
-        df_groups = req_df.groupby(aggregations)
+        # The table already has the response time aggregated per creation time
+        # for each group, sorted by creation time inside each group
+        df_groups = df_table.groupby(aggregations, observed=True)
 
         for name, group in df_groups:
-            if agg_type == "max":
-                g = group.groupby("creation").resp_time.max().reset_index()
-            else:
-                g = group.groupby("creation").resp_time.mean().reset_index()
+            g = downsample(group, agg_type)
             name = name if isinstance(name, str) else "-".join(name)
             fig.add_trace(
-                go.Scatter(x=g.creation, y=g.resp_time, mode="lines+markers", name=name)
+                go.Scattergl(
+                    x=g.creation, y=g.resp_time, mode="lines+markers", name=name
+                )
             )
 
         fig.update_xaxes(title="Creation time (s)")
@@ -595,8 +774,10 @@ def get_resp_time_plot(req_df, df_table, aggregations, agg_type):
 
         # Add a column with the combination of the aggreated columns to be used
         # as name for the bars
-        df_table["x"] = df_table[aggregations].apply(
-            lambda x: "-".join(x.astype(str)), axis=1
+        df_table["x"] = (
+            df_table[aggregations[0]]
+            .astype(str)
+            .str.cat([df_table[c].astype(str) for c in aggregations[1:]], sep="-")
         )
 
         fig = px.bar(df_table, x="x", y="resp_time", color=color)
@@ -605,62 +786,113 @@ def get_resp_time_plot(req_df, df_table, aggregations, agg_type):
         fig = px.bar(req_df, x="req", y="resp_time", color="app")
 
     fig.update_yaxes(title=f"{agg_type} resp time (s)")
+
+    # Keep the zoom and pan of the user when the figure is updated
+    fig.update_layout(uirevision="detail")
     return dcc.Graph(id="resp-time-graph", figure=fig)
 
 
+def rank_by_req(df_req, column):
+    """Returns the position (starting at 1) of each request among the requests
+    with the same value in column, ordered by request number."""
+    ranks = (
+        df_req.sort_values("req", kind="stable")
+        .groupby(column, observed=True)
+        .cumcount()
+        + 1
+    )
+    return ranks.reindex(df_req.index)
+
+
+def to_datetime_concat(first, second):
+    """Returns the times in seconds of both Series, one after the other, as
+    datetimes."""
+    return pd.to_datetime(np.concatenate((first.values, second.values)), unit="s")
+
+
+@memoize_while_unmodified("_reqs.csv")
 def get_gantt(gantt_type, base_dir, prefix, first_req, last_req, app_filter):
-    df_req = pd.read_csv(f"{base_dir}/{prefix}_reqs.csv", nrows=last_req)
+    df_req = read_reqs(
+        f"{base_dir}/{prefix}_reqs.csv", first_req, last_req, usecols=gantt_cols
+    )
 
     if app_filter != "":
         df_req = df_req[df_req.app == app_filter]
 
-    df_req = df_req[(df_req.req >= first_req) & (df_req.req <= last_req)]
-
-    df_req["x_start"] = pd.to_datetime(df_req["creation"], unit="s")
-    df_req["x_end"] = pd.to_datetime(df_req["start"], unit="s")
-    df_req["type"] = "Waiting"
-
     # Obtain a continuous index for each app or vm
-    df_req["req_app"] = df_req.groupby(gantt_type)["req"].rank(
-        method="first", ascending=True
+    req_app = rank_by_req(df_req, gantt_type)
+    real_req_app = rank_by_req(df_req, "app")
+
+    # Each request is included twice, first with type "Service" and then with
+    # type "Waiting", so the waiting and the service time are plotted at the
+    # same time
+    n = len(df_req)
+    df_all = pd.DataFrame(
+        {
+            "x_start": to_datetime_concat(df_req.start, df_req.creation),
+            "x_end": to_datetime_concat(df_req.end, df_req.start),
+            "type": pd.Categorical.from_codes(
+                np.repeat([0, 1], n), categories=["Service", "Waiting"]
+            ),
+            "req_app": np.tile(req_app.values, 2),
+            "real_req_app": np.tile(real_req_app.values, 2),
+            "app": np.tile(df_req.app.values, 2),
+            "vm": np.tile(df_req.vm.values, 2),
+        }
     )
-    df_req["real_req_app"] = df_req.groupby("app")["req"].rank(
-        method="first", ascending=True
+
+    codes, plot_order = pd.factorize(df_req[gantt_type], sort=True)
+    plot_order = list(plot_order)
+    if not plot_order:
+        return []
+
+    # All the VMs or apps are plotted in one figure, with a facet row for each
+    # one, and the height of each facet depends on its number of requests
+    # (each one has two rows in df_all)
+    rows = 2 * np.bincount(codes, minlength=len(plot_order))
+    heights = [max(gantt_min_facet_height, 18 * int(r)) for r in rows]
+
+    gantt = px.timeline(
+        df_all,
+        x_start="x_start",
+        x_end="x_end",
+        y="req_app",
+        color="type",
+        color_discrete_sequence=app_exec_color,
+        facet_row=gantt_type,
+        facet_row_spacing=0,
+        text="real_req_app" if gantt_type == "vm" else "vm",
+        category_orders={gantt_type: plot_order},
     )
 
-    # Copy all requests and change the type to "Service" so the waiting and the
-    # service time are plotted at the same time
-    df_service = df_req.copy()
-    df_service["x_start"] = pd.to_datetime(df_service["start"], unit="s")
-    df_service["x_end"] = pd.to_datetime(df_service["end"], unit="s")
-    df_service["type"] = "Service"
-    df_all = pd.concat([df_service, df_req])
-
-    plot_order = sorted(list(df_req[gantt_type].unique()))
-
-    figs = []
-    for i in plot_order:
-        df_i = df_all[df_all[gantt_type] == i]
-
-        gantt = px.timeline(
-            df_i,
-            x_start="x_start",
-            x_end="x_end",
-            y="req_app",
-            color="type",
-            color_discrete_sequence=app_exec_color,
-            facet_row=gantt_type,
-            text="real_req_app" if gantt_type == "vm" else "vm",
-            category_orders={gantt_type: plot_order},
-        )
+    gantt.update_yaxes(autorange="reversed", matches=None)
+
+    set_facet_heights(gantt, gantt_type, plot_order, heights)
+    gantt.update_layout(
+        autosize=True,
+        height=sum(heights) + gantt_facet_gap * (len(heights) - 1) + 120,
+        margin={"t": 60, "b": 60},
+        uirevision=gantt_type,
+    )
 
-        gantt.update_yaxes(autorange="reversed", matches=None)
+    return [dcc.Graph(id="gantt", figure=gantt)]
 
-        gantt.update_layout(autosize=True, height=max(300, 18 * len(df_i)))
 
-        figs.append(dcc.Graph(id=f"gantt_{i}", figure=gantt))
+def set_facet_heights(fig, facet_row, names, heights):
+    """Changes the domain of each facet row in a plotly express figure so that
+    it takes the height in pixels indicated in heights. The facets are given
+    from top to bottom."""
+    total = sum(heights) + gantt_facet_gap * (len(heights) - 1)
+    annotations = {a.text: a for a in fig.layout.annotations}
 
-    return figs
+    # The first facet (the one at the top) has the last y axis
+    top = total
+    for axis_num, name, height in zip(range(len(names), 0, -1), names, heights):
+        axis = "yaxis" if axis_num == 1 else f"yaxis{axis_num}"
+        domain = ((top - height) / total, top / total)
+        fig.layout[axis].domain = domain
+        annotations[f"{facet_row}={name}"].y = sum(domain) / 2
+        top -= height + gantt_facet_gap
 
 
 @app.callback(
@@ -678,9 +910,7 @@ def apply_new_dir_util(n_clicks, base_dir, prefix, first_req, last_req):
         first_req = int(first_req)
         last_req = int(last_req)
 
-        df = pd.read_csv(f"{base_dir}/{prefix}_utils.csv")
-
-        fig = px.bar(x=df.vm_name, y=df.util, color=df.ic)
+        return get_utils(base_dir, prefix)
     except Exception as e:
         print("Error in apply_new_dir_util:", e)
         fig = go.Figure()
@@ -699,7 +929,20 @@ def apply_new_dir_util(n_clicks, base_dir, prefix, first_req, last_req):
         )
         return fig, None, None
 
-    return fig, df.to_dict("records"), dash_cols(df)
+
+@memoize_while_unmodified("_utils.csv")
+def get_utils(base_dir, prefix):
+    df = read_csv_cached(
+        f"{base_dir}/{prefix}_utils.csv",
+        dtype=utils_dtypes,
+        engine="c",
+        memory_map=True,
+    )
+
+    fig = px.bar(x=df.vm_name, y=df.util, color=df.ic)
+    fig.update_layout(uirevision="util")
+
+    return fig, dash_records(df), dash_cols(df)
 
 
 @app.callback(
@@ -713,51 +956,30 @@ def apply_new_dir_util(n_clicks, base_dir, prefix, first_req, last_req):
 )
 def apply_new_dir_events(n_clicks, page_current, page_size, base_dir, prefix):
     try:
-        with open(f"{base_dir}/{prefix}_events.csv") as csv_file:
-            line_start = page_current * page_size
-            line_end = line_start + page_size
-            lines = islice(csv_file, line_start, line_end)
-            row_list = []
-            for line in lines:
-                fields = line.split(",")
-                event = EvType(int(fields[1]))
-                row = {
-                    "time": fields[0],
-                    "event": event.name,
-                    "req": "",
-                    "app": "",
-                    "vm": "",
-                    "ic": "",
-                    "price": "",
-                }
+        df_ev = pd.read_csv(
+            read_lines(
+                f"{base_dir}/{prefix}_events.csv", page_current * page_size, page_size
+            ),
+            header=None,
+            names=events_fields,
+            dtype=str,
+            keep_default_na=False,
+        )
+        ev = df_ev.ev.astype(int)
+
+        df = pd.DataFrame({"time": df_ev.time, "event": ev.map(event_names)})
+        for col in events_cols:
+            df[col] = ""
 
-                if event == EvType.VM_START:
-                    row["vm"] = fields[2]
-                    row["ic"] = fields[3]
-                    row["price"] = fields[4]
-                elif event == EvType.VM_END:
-                    row["vm"] = fields[2]
-                elif event == EvType.VM_ASSIGN_APP:
-                    row["vm"] = fields[2]
-                    row["app"] = fields[3]
-                elif event == EvType.REQ_CREATION:
-                    row["req"] = fields[2]
-                    row["app"] = fields[3]
-                elif event == EvType.REQ_START:
-                    row["req"] = fields[2]
-                    row["vm"] = fields[3]
-                    row["app"] = fields[4]
-                elif event == EvType.REQ_END:
-                    row["req"] = fields[2]
-
-                row_list.append(row)
-
-            df = pd.DataFrame(row_list)
+        for event, fields in events_fields_per_type.items():
+            mask = ev == event.value
+            for col, field in fields.items():
+                df.loc[mask, col] = df_ev.loc[mask, field]
     except Exception as e:
         print("Error in apply_new_dir_events:", e)
         return None, None
 
-    return df.to_dict("records"), dash_cols(df)
+    return dash_records(df), dash_cols(df)
 
 
 @click.command()
@@ -1,41 +1,81 @@
 '''This module defines the command line interface for simlloovia.
 '''
-import sys
-from typing import List, Dict
-import pickle
+import csv
+from contextlib import redirect_stdout
+from typing import List, Dict, Tuple, TYPE_CHECKING
 from dataclasses import asdict
 
 import click
 import click_config_file
-import pandas as pd
-import malloovia
 
-from .simulator import Simulator
-from .core import Vm
+# The simulator and malloovia are imported only when a simulation is run,
+# so that --help and argument errors are fast
+if TYPE_CHECKING:
+    from .core import Vm
 
-def save_req_times(output_prefix: str, output_dir: str, req_times: List[List]):
+# Buffer size for the output files, which can have millions of lines, and for
+# reading pickled solutions
+OUTPUT_BUFFER_SIZE = 1 << 20
+
+# Number of lines of the requests file joined before writing them (about 64 KB)
+REQS_CHUNK_LINES = 2048
+
+# Template for the lines of the requests file. The app and VM columns are
+# formatted before, so the VM field includes the ic column
+REQS_LINE = '%s,%s,%s,%s,%s,%s,%s\n'
+
+def save_req_times(output_prefix: str, output_dir: str, req_times: List[Tuple]):
     '''Saves request event times (creation, start and end) in the file
        reqs:csv, where each line has all the events for a request
     '''
-    with open(f'{output_dir}/{output_prefix}_reqs.csv', 'w') as f_reqs:
+    with open(f'{output_dir}/{output_prefix}_reqs.csv', 'w',
+            buffering=OUTPUT_BUFFER_SIZE) as f_reqs:
         f_reqs.write('req,creation,start,end,app,vm,ic,lost\n')
 
-        for e in req_times:
-            f_reqs.write(f'{e[0]},{e[1]},{e[2]},{e[3]},a{e[4].name}'\
-                        f',{e[5].name()},{e[5].ic.id},{e[6]}\n')
+        # There are few apps and VMs, so their columns are formatted once
+        apps = {app: f'a{app.name}' for app in {e[4] for e in req_times}}
+        vms = {vm: f'{vm.name()},{vm.ic.id}' for vm in {e[5] for e in req_times}}
+
+        # The lines are joined in chunks to write fewer, larger strings. They
+        # are formatted in Python because the times are written with repr(),
+        # which keeps integer times as integers and floats with all their
+        # digits
+        for first in range(0, len(req_times), REQS_CHUNK_LINES):
+            chunk = req_times[first:first + REQS_CHUNK_LINES]
+            f_reqs.write(''.join([REQS_LINE % (e[0], e[1], e[2], e[3],
+                                               apps[e[4]], vms[e[5]], e[6])
+                                  for e in chunk]))
 
 def save_events(output_prefix: str, output_dir: str, events: List[str]):
     '''Saves a detailed event list'''
-    with open(f'{output_dir}/{output_prefix}_events.csv', 'w') as f_reqs:
-        for ev in events:
-            f_reqs.write(f'{ev}\n')
+    with open(f'{output_dir}/{output_prefix}_events.csv', 'w',
+            buffering=OUTPUT_BUFFER_SIZE) as f_reqs:
+        f_reqs.writelines(f'{ev}\n' for ev in events)
 
 def save_vm_utils(output_prefix: str, output_dir: str,
-        vm_utils: Dict[Vm, float]):
-    with open(f'{output_dir}/{output_prefix}_utils.csv', 'w') as f:
+        vm_utils: Dict['Vm', float]):
+    with open(f'{output_dir}/{output_prefix}_utils.csv', 'w',
+            buffering=OUTPUT_BUFFER_SIZE) as f:
         f.write('vm_name,ic,util\n')
-        for vm in vm_utils:
-            f.write(f'{vm.name()},{vm.ic.id},{vm_utils[vm]}\n')
+        f.writelines(f'{vm.name()},{vm.ic.id},{util}\n'
+                     for vm, util in vm_utils.items())
+
+def print_stats(stats_dict: Dict):
+    '''Prints the stats with one line per stat, with the names and the values
+    aligned in columns'''
+    values = {name: str(value) for name, value in stats_dict.items()}
+    name_width = max(len(name) for name in values)
+    value_width = max(len(value) for value in values.values())
+    for name, value in values.items():
+        print(f'{name:<{name_width}}  {value:>{value_width}}')
+
+def save_stats(output_prefix: str, output_dir: str, stats_dict: Dict):
+    '''Saves the stats in the file {output_prefix}.csv, with a line per stat.
+    None values are saved as empty fields'''
+    with open(f'{output_dir}/{output_prefix}.csv', 'w', newline='') as f:
+        writer = csv.writer(f, lineterminator='\n')
+        writer.writerow(['', 0])
+        writer.writerows(stats_dict.items())
 
 # pylint: disable=no-value-for-parameter
 @click.command()
@@ -58,64 +98,73 @@ def save_vm_utils(output_prefix: str, output_dir: str,
 @click_config_file.configuration_option(implicit=False)
 def simulate(sol_file, workload, workload_period, output_prefix, output_dir,
         workload_length, trace, save_evs, save_utils, quantum):
-    sys.stdout = open(f'{output_dir}/{output_prefix}_out.txt', 'w')
-
-    if sol_file.endswith('p'):
-        sol = pickle.load(open(sol_file, 'rb'))
-    elif sol_file.endswith('yaml'):
-        sols = malloovia.util.read_solutions_from_yaml(sol_file)
-        if len(sols) > 1:
-            print('WARNING: only the first solution in the file will be '\
-                  'simulated')
-        sol = list(sols.values())[0]
-    else:
-        raise Exception('The solution file extension has to be ".p" (for '\
-            'pickle) or ".yaml" (for YAML)')
+    # The arguments are checked before creating any file or loading anything
+    if not sol_file.endswith(('p', 'yaml')):
+        raise click.BadParameter('The solution file extension has to be ".p" '\
+            '(for pickle) or ".yaml" (for YAML)', param_hint='--sol-file')
 
     if workload and not workload_period:
-        raise Exception('If workload is passed, the workload_period has to be passed')
+        raise click.BadParameter('If workload is passed, the workload_period '\
+            'has to be passed', param_hint='--workload-period')
 
     if workload_period and not workload:
-        raise Exception('If workload_period is passed, the workload has to be passed')
-
-    simulator = Simulator()
-
-    if workload:
-        sim_stats = simulator.simulate_malloovia_workload_file(solution=sol,
-            workload_filename_prefix=workload, workload_period_sec=workload_period,
-            workload_length=workload_length, quantum_sec=quantum,
-            animate=False, speed=0.1, trace=trace)
-    else:
-        sim_stats = simulator.simulate_malloovia(sol,
-            workload_length=workload_length, quantum_sec=quantum,
-            animate=False, speed=0.1, trace=False)
-
-    print(f'Simulation stats for {sol_file}')
-    if workload:
-        print(f'Workload: {workload}. Length: {workload_length}')
-    print(sim_stats)
-    print()
-
-    stats_dict = asdict(sim_stats)
-
-    # Add info about the parameters used to simulate
-    stats_dict['sol_file'] = sol_file
-    stats_dict['workload'] = workload
-    stats_dict['workload_period'] = workload_period
-    stats_dict['workload_length'] = workload_length
-
-    df = pd.Series(stats_dict)
-    print(df)
-
-    df.to_csv(f'{output_dir}/{output_prefix}.csv')
-
-    if save_evs:
-        save_req_times(output_prefix, output_dir, simulator.get_req_times())
-
-    if save_utils:
-        save_vm_utils(output_prefix, output_dir, simulator.get_vm_utils())
-
-    save_events(output_prefix, output_dir, simulator.get_events())
+        raise click.BadParameter('If workload_period is passed, the workload '\
+            'has to be passed', param_hint='--workload')
+
+    # The output goes to a file with a large buffer instead of to memory, so
+    # that traced simulations, which print every event, use constant memory
+    with open(f'{output_dir}/{output_prefix}_out.txt', 'w',
+            buffering=OUTPUT_BUFFER_SIZE) as out, redirect_stdout(out):
+        import malloovia
+        from .simulator import Simulator
+
+        if sol_file.endswith('p'):
+            import pickle
+            with open(sol_file, 'rb', buffering=OUTPUT_BUFFER_SIZE) as f_sol:
+                sol = pickle.load(f_sol)
+        else:
+            sols = malloovia.util.read_solutions_from_yaml(sol_file)
+            if len(sols) > 1:
+                print('WARNING: only the first solution in the file will be '\
+                      'simulated')
+            sol = next(iter(sols.values()))
+
+        simulator = Simulator()
+
+        if workload:
+            sim_stats = simulator.simulate_malloovia_workload_file(solution=sol,
+                workload_filename_prefix=workload, workload_period_sec=workload_period,
+                workload_length=workload_length, quantum_sec=quantum,
+                animate=False, speed=0.1, trace=trace)
+        else:
+            sim_stats = simulator.simulate_malloovia(sol,
+                workload_length=workload_length, quantum_sec=quantum,
+                animate=False, speed=0.1, trace=False)
+
+        print(f'Simulation stats for {sol_file}')
+        if workload:
+            print(f'Workload: {workload}. Length: {workload_length}')
+        print(sim_stats)
+        print()
+
+        stats_dict = asdict(sim_stats)
+
+        # Add info about the parameters used to simulate
+        stats_dict['sol_file'] = sol_file
+        stats_dict['workload'] = workload
+        stats_dict['workload_period'] = workload_period
+        stats_dict['workload_length'] = workload_length
+
+        print_stats(stats_dict)
+        save_stats(output_prefix, output_dir, stats_dict)
+
+        if save_evs:
+            save_req_times(output_prefix, output_dir, simulator.get_req_times())
+
+        if save_utils:
+            save_vm_utils(output_prefix, output_dir, simulator.get_vm_utils())
+
+        save_events(output_prefix, output_dir, simulator.get_events())
 
 if __name__ == "__main__":
     simulate()
@@ -5,9 +5,10 @@ and using simpy.
 It assumes one simulation tick is one second."""
 
 import time
+import heapq
 from sys import float_info
-from collections import defaultdict
-from itertools import islice
+from collections import defaultdict, deque
+from itertools import islice, count
 from typing import Sequence, List, Dict, Optional, Tuple
 import simpy
 
@@ -16,6 +17,10 @@ from malloovia import (InstanceClass, PerformanceSet, PerformanceValues, App,
 
 from .monitor import Monitor, EvType
 
+# Seconds in each time unit, so that a TimeUnit is not built for every VM
+SEC_PER_TIME_UNIT = {unit: TimeUnit(unit).to('s')
+                     for unit in TimeUnit.conversion_factors}
+
 class Request():
     '''Data object to save the creation, start_proc and end_proc times of a
     request, in addition to its number. The class has static variables to count
@@ -24,16 +29,24 @@ class Request():
     Args:
         env: simpy enviroment
         app: app corresponding to the request
+        num: request number. If None, the next one in the count is used
     '''
 
     count: int = 0
 
-    def __init__(self, env: simpy.Environment, app: App):
+    # Many requests are created, so avoid a __dict__ per request
+    __slots__ = ('env', 'app', 'num', 'creation_time', 'start_proc_time',
+                 'end_proc_time', 'lost', 'vm')
+
+    def __init__(self, env: simpy.Environment, app: App,
+                 num: Optional[int] = None):
         self.env: simpy.Environment = env
         self.app: App = app
 
-        self.num: int = Request.count
-        Request.count += 1
+        if num is None:
+            num = Request.count
+            Request.count += 1
+        self.num: int = num
 
         self.creation_time: float = env.now
         self.start_proc_time: float = -float_info.max  # Not initialized
@@ -100,47 +113,85 @@ class LoadBalancer():
         self.request_sink = request_sink
         self.monitor = monitor
 
-        # Dict where the keys are malloovia apps and the values are list of VMs
-        self.vms: Dict[App, List[Vm]] = defaultdict(list)
-
-        self.store = simpy.Store(env) # stores requests
-        self.action = env.process(self.__process())
-
-    def __process(self):
-        while True:
-            req = (yield self.store.get())
-            self.__distribute_req(req, self.vms[req.app])
-
-    def __distribute_req(self, req: Request, vms_for_app: List['Vm']):
+        # Dict where the keys are malloovia apps and the values are the VMs of
+        # the app. They are kept in dicts used as ordered sets, so that a VM can
+        # be removed without searching for it
+        self.vms: Dict[App, Dict[Vm, None]] = defaultdict(dict)
+
+        # Heap per app to find the VM with the least remaining processing time
+        # without going through all of them. Each entry is (remaining time,
+        # position of the VM in its pool, push number, VM). A new entry is
+        # pushed whenever the remaining time of a VM changes, and the outdated
+        # ones are discarded when they get to the top
+        self.vm_heaps: Dict[App, List[Tuple[float, int, int, Vm]]] = defaultdict(list)
+        self.vm_positions: Dict[Vm, int] = {} # Only for the VMs in self.vms
+        self.position_count = count()
+        self.push_count = count()
+
+    def __distribute_req(self, req: Request, vms_for_app: Dict['Vm', None]):
         if not vms_for_app:
             req.mark_as_lost()
             self.monitor.add_req_lost(req)
             self.request_sink.add_request(req)
             return
 
-        # Look for the VM for this app with maximum free capacity
-        max_vm = min(vms_for_app, key=lambda vm: vm.remaining_processing_time_sec())
+        # Look for the VM for this app with the least remaining processing time.
+        # In a tie, the one that was added first to the pool wins
+        heap = self.vm_heaps[req.app]
+        while True:
+            remaining_sec, position, _, vm = heap[0]
+            if (self.vm_positions.get(vm) == position
+                    and vm.remaining_processing_time_sec() == remaining_sec):
+                break
+            heapq.heappop(heap) # Outdated entry
 
-        max_vm.add_request(req)
+        vm.add_request(req)
 
     def add_request(self, req):
-        '''Receive a new request that must be processed'''
-        self.store.put(req)
+        '''Receive a new request that must be processed. It is sent to a VM
+        right away'''
+        self.__distribute_req(req, self.vms[req.app])
+
+    def add_requests(self, reqs: List[Request]):
+        '''Receive a list of new requests that must be processed'''
+        for req in reqs:
+            self.__distribute_req(req, self.vms[req.app])
 
     def update_vm_pool(self, vm: 'Vm'):
         '''Receives a VM and adds it to the pool of available VMs for the
         app indicated in the VM'''
 
-        # Remove from any existing list
-        for vms_for_app in self.vms.values():
-            if vm in vms_for_app:
-                vms_for_app.remove(vm)
+        # If it was already in the pool, it is moved to the end. A VM cannot
+        # change its app, so it can only be in the pool of its app
+        vms_for_app = self.vms[vm.app]
+        vms_for_app.pop(vm, None)
+        vms_for_app[vm] = None
 
-        self.vms[vm.app].append(vm)
+        self.vm_positions[vm] = next(self.position_count)
+        self.__push_vm(vm)
 
     def remove_vm(self, vm: 'Vm'):
         '''Removes a VM from the list of available VMs'''
-        self.vms[vm.app].remove(vm)
+        del self.vms[vm.app][vm]
+        del self.vm_positions[vm]
+
+    def update_vm_load(self, vm: 'Vm'):
+        '''Indicates that the remaining processing time of a VM has changed'''
+        if vm in self.vm_positions:
+            self.__push_vm(vm)
+
+    def __push_vm(self, vm: 'Vm'):
+        heap = self.vm_heaps[vm.app]
+        vms_for_app = self.vms[vm.app]
+
+        if len(heap) > 2*len(vms_for_app) + 64:
+            # Too many outdated entries. Rebuild the heap with the current ones
+            heap[:] = [(v.remaining_processing_time_sec(), self.vm_positions[v],
+                        next(self.push_count), v) for v in vms_for_app]
+            heapq.heapify(heap)
+        else:
+            heapq.heappush(heap, (vm.remaining_processing_time_sec(),
+                                  self.vm_positions[vm], next(self.push_count), vm))
 
     def end_sim(self):
         '''Indicates to all the running VMs that the simulation has finished'''
@@ -187,6 +238,7 @@ class Vm:
         self.current_proc_reqs: List[Request]  = [] # Requests being processed now
         self.current_req_start: Dict[Request, float] = {}  # No req being processed
         self.current_req_remaining_sec: Dict[Request, float] = {}  # No req being processed
+        self.remaining_sec: float = 0 # Sum of current_req_remaining_sec
 
         self.ic: InstanceClass = ic
         self.perfs: PerformanceSet = perfs
@@ -196,6 +248,7 @@ class Vm:
         self.quantum_sec = quantum_sec
 
         # Not initialized until the app is assigned
+        self.perf_sec: float = -float_info.max
         self.serv_time_sec: float = -float_info.max
 
         # Fields por computing the utilization and the cost
@@ -203,76 +256,97 @@ class Vm:
         self.stop_time: float = -float_info.max # Set when the machine stops
         self.sec_used: float = 0 # Accumulated seconds used in computing requests
         self.time_comp_ends: Dict[Request, float] = {} # Indicates when the current computation ends
+        self.price_per_sec: float = ic.price / SEC_PER_TIME_UNIT[ic.time_unit]
 
         self.monitor = monitor
         self.monitor.add_event(f'{self.env.now},{EvType.VM_START.value},{self.num},{self.ic.id},{self.ic.price}')
 
-        self.cores = simpy.Resource(env, capacity=ic.cores)
+        # Requests waiting for a free core and number of busy cores. Each
+        # quantum is a single timeout whose callback continues the round robin
+        self.queue: deque = deque()
+        self.busy_cores: int = 0
 
     def __perf_sec(self, app: App):
         perf = self.perfs.values[self.ic, app]
-        return perf / TimeUnit(self.perfs.time_unit).to('s')
+        return perf / SEC_PER_TIME_UNIT[self.perfs.time_unit]
+
+    def __start_quantum(self, req: Request):
+        '''Assigns a free core to the request for a quantum'''
+        self.busy_cores += 1
+
+        if self.current_req_remaining_sec[req] == self.serv_time_sec:  # First quantum
+            req.start_proc(self)
+            self.monitor.add_event(f'{self.env.now},{EvType.REQ_START.value},{req.num},{self.num},{self.app.id}')
+
+        req_remaining_sec = self.current_req_remaining_sec[req]
+        processing_time_sec = min(self.quantum_sec, req_remaining_sec)
+
+        self.current_proc_reqs.append(req)
+        self.current_req_start[req] = self.env.now
+        self.time_comp_ends[req] = self.env.now + processing_time_sec
+
+        timeout = self.env.timeout(processing_time_sec)
+        timeout.callbacks.append(
+            lambda _: self.__end_quantum(req, processing_time_sec))
+
+    def __end_quantum(self, req: Request, processing_time_sec: float):
+        '''Releases the core used by the request and gives it to the next
+        request in the queue'''
+        self.current_proc_reqs.remove(req)
+        del self.time_comp_ends[req]
+        del self.current_req_start[req]
+
+        self.current_req_remaining_sec[req] -= processing_time_sec
+        self.remaining_sec -= processing_time_sec
+        self.sec_used += processing_time_sec
+
+        if self.current_req_remaining_sec[req] > float_info.epsilon:
+            # More processing required
+            self.load_balancer.update_vm_load(self)
+            self.queue.append(req)  # Ask for another quantum
+        else:
+            # Done
+            req.end_proc()
+            self.__remove_remaining_sec(req)
+            self.monitor.add_event(f'{self.env.now},{EvType.REQ_END.value},{req.num}')
+            self.out.add_request(req)
 
-    def __service_time_sec(self, app: App):
-        return self.ic.cores / self.__perf_sec(app)
+            # Notice that busy_cores has to be 1 because this request has
+            # not released its core yet
+            if self.is_shutting_down and self.busy_cores == 1 and not self.queue:
+                self.stop_time = self.env.now
+                self.monitor.add_event(f'{self.env.now},{EvType.VM_END.value},{self.num}')
 
-    def __process_req(self, req: Request):
+        self.busy_cores -= 1
+        if self.queue:
+            self.__start_quantum(self.queue.popleft())
+
+    def add_request(self, req):
+        '''Receive a request that must be processed'''
         if req.app != self.app:
             msg = 'Invalid app for this VM {}. Expected: {}. Received: {}'\
                 ' Time: {}'.format(self.name(), self.app, req.app,
                 self.env.now)
             raise Exception(msg)
 
-        with self.cores.request() as core:
-            yield core
-
-            if self.current_req_remaining_sec[req] == self.serv_time_sec:  # First quantum
-                req.start_proc(self)
-                self.monitor.add_event(f'{self.env.now},{EvType.REQ_START.value},{req.num},{self.num},{self.app.id}')
-
-            req_remaining_sec = self.current_req_remaining_sec[req]
-            processing_time_sec = min(self.quantum_sec, req_remaining_sec)
-
-            self.current_proc_reqs.append(req)
-            self.current_req_start[req] = self.env.now
-            self.time_comp_ends[req] = self.env.now + processing_time_sec
-
-            yield self.env.timeout(processing_time_sec)
-
-            self.current_proc_reqs.remove(req)
-            del self.time_comp_ends[req]
-            del self.current_req_start[req]
+        self.current_req_remaining_sec[req] = self.serv_time_sec
+        self.remaining_sec += self.serv_time_sec
+        self.load_balancer.update_vm_load(self)
 
-            self.current_req_remaining_sec[req] -= processing_time_sec
-            self.sec_used += processing_time_sec
-
-            if self.current_req_remaining_sec[req] > float_info.epsilon:
-                # More processing required
-                self.add_request(req)  # Ask for another quantum
-            else:
-                # Done
-                req.end_proc()
-                del self.current_req_remaining_sec[req]
-                self.monitor.add_event(f'{self.env.now},{EvType.REQ_END.value},{req.num}')
-                self.out.add_request(req)
-
-                # Notice that cores.count has to be 1 because we are still
-                # inside the "with self.cores.request()"
-                if self.is_shutting_down and self.cores.count == 1 and not self.cores.queue:
-                    self.stop_time = self.env.now
-                    self.monitor.add_event(f'{self.env.now},{EvType.VM_END.value},{self.num}')
-
-    def add_request(self, req):
-        '''Receive a request that must be processed'''
-        if req not in self.current_req_remaining_sec:  # New request
-            self.current_req_remaining_sec[req] = self.serv_time_sec
-
-        self.env.process(self.__process_req(req))
+        if self.busy_cores < self.ic.cores:
+            self.__start_quantum(req)
+        else:
+            self.queue.append(req)
 
     def begin_shutdown(self):
         '''Indicate that the VM has to start the shutdown process. Thus, it will
         not be available for the distributor. However, all requests in the queue
-        will be processed.'''
+        will be processed.
+
+        A core starts the next request in the queue in the same step where it
+        finishes a quantum. Thus, if the shutdown happens at the same instant
+        where a quantum ends, that next request is reported as still executing
+        and not as pending, so the pending count has one request less.'''
         if self.ic.is_reserved:
             print(f'WARNING: shutting down reserved instance ({self.name()}) at'
                   f' time {self.env.now}')
@@ -281,9 +355,9 @@ class Vm:
             print(f'WARNING: shutting down VM {self.name()}, which is still'
                   f' executing a request at time {self.env.now}')
 
-        if len(self.cores.queue) > 0:
+        if len(self.queue) > 0:
             print(f'WARNING: shutting down VM {self.name()} with'
-                f' {len(self.cores.queue)} pending requests at time'
+                f' {len(self.queue)} pending requests at time'
                 f' {self.env.now}')
 
         self.load_balancer.remove_vm(self)  # So that it doesn't receive more requests
@@ -301,11 +375,11 @@ class Vm:
         still been processed'''
         now = self.env.now
         comp_end_values = self.time_comp_ends.values()
-        return self.cores.count > 0 and all(i > now for i in comp_end_values)
+        return self.busy_cores > 0 and all(i > now for i in comp_end_values)
 
     def requests_in_queue_or_processing(self):
         '''Indicate if there are requests in the queue or processing'''
-        return self.cores.queue or self.is_computing()
+        return self.queue or self.is_computing()
 
     def is_free(self):
         '''Returns True is there is no app asigned or there are no requests,
@@ -321,9 +395,11 @@ class Vm:
             raise Exception(msg)
 
         if self.app != app:
-            self.monitor.add_event(f'{self.env.now},{EvType.VM_ASSIGN_APP.value},{self.num},{app.id},{self.__perf_sec(app)}')
-
-        self.serv_time_sec = self.__service_time_sec(app)
+            # The performance only changes with the app, so it is computed here
+            # and not for each request
+            self.perf_sec = self.__perf_sec(app)
+            self.serv_time_sec = self.ic.cores / self.perf_sec
+            self.monitor.add_event(f'{self.env.now},{EvType.VM_ASSIGN_APP.value},{self.num},{app.id},{self.perf_sec}')
 
         self.app = app
         self.load_balancer.update_vm_pool(self)
@@ -331,12 +407,7 @@ class Vm:
     def compute_period_cost(self, period_sec):
         '''Returns the cost of running the VM for a period expressed in seconds.
         It uses per-second billing without a minimum billing period.'''
-        price = self.ic.price
-        price_units = self.ic.time_unit
-        sec_per_price_unit = TimeUnit(price_units).to('s')
-        price_per_sec = price / sec_per_price_unit
-
-        return period_sec * price_per_sec
+        return period_sec * self.price_per_sec
 
     def __sec_running(self):
         '''Returns the seconds the VM has been running until now (or when it
@@ -370,21 +441,31 @@ class Vm:
         '''Returns the free capacity approximated by the 1 minus the proportion
         of requests per time unit that the VM can handle'''
         req_count = len(self.current_req_remaining_sec)
-        return 1 - (req_count / self.__perf_sec(self.app))
+        return 1 - (req_count / self.perf_sec)
 
     def remaining_processing_time_sec(self) -> float:
         '''Returns how many seconds have to be processed with the assigned
         requests'''
-        return sum(self.current_req_remaining_sec.values())/self.ic.cores
+        return self.remaining_sec/self.ic.cores
+
+    def __remove_remaining_sec(self, req: Request):
+        '''Removes a request from current_req_remaining_sec and updates
+        remaining_sec'''
+        self.remaining_sec -= self.current_req_remaining_sec.pop(req)
+        if not self.current_req_remaining_sec:
+            self.remaining_sec = 0 # Don't accumulate rounding errors
+
+        self.load_balancer.update_vm_load(self)
 
     def get_pending_requests(self):
         '''Returns the number of pending requests for this VM. It includes the
         requests currently being executed (if they don't finish in this time
         slot) and the ones in the queue'''
-        res = len(self.cores.queue)
+        res = len(self.queue)
 
+        now = self.env.now
         for end in self.time_comp_ends.values():
-            if end > self.env.now:
+            if end > now:
                 res += 1
 
         return res
@@ -405,7 +486,7 @@ class Vm:
 
             del self.current_req_start[req]
             del self.time_comp_ends[req]
-            del self.current_req_remaining_sec[req]
+            self.__remove_remaining_sec(req)
 
             if end == self.env.now:
                 req.end_proc()
@@ -424,7 +505,7 @@ class WorkloadInjector():
             all the periods present in the first workload will be injected. All
             workloads are assumed to have the same length.
         out: where to send the requests. It must be an object that has the
-            function add_request(). Typically, it will be the LoadBalancer.
+            function add_requests(). Typically, it will be the LoadBalancer.
         monitor: Monitor class that will be informed each time a request is
             injected.
     '''
@@ -448,12 +529,25 @@ class WorkloadInjector():
             print('Warning: float values in workloads will be casted to int')
 
         requests = int(requests)
+        if requests == 0:
+            return
 
-        for _ in range(requests):
-            req = Request(env=self.env, app=workload.app)
-            self.monitor.add_event(f'{self.env.now},{EvType.REQ_CREATION.value},{req.num},{workload.app.id}')
-            self.out.add_request(req)
-            self.monitor.add_req_injected(req)
+        # Reserve the request numbers for the time slot at once
+        first_num = Request.count
+        Request.count += requests
+
+        reqs = [Request(env=self.env, app=workload.app, num=num)
+                for num in range(first_num, first_num + requests)]
+
+        # The monitor receives all the requests of the time slot at once
+        ev_prefix = f'{self.env.now},{EvType.REQ_CREATION.value}'
+        app_id = workload.app.id
+        self.monitor.add_events([f'{ev_prefix},{req.num},{app_id}'
+                                 for req in reqs])
+        self.monitor.add_reqs_injected(reqs)
+
+        # All the requests of the time slot are sent at once
+        self.out.add_requests(reqs)
 
     def __time_to_str(self, t):
         fmt_str = "%H:%M.%S"
@@ -580,12 +674,9 @@ class VmManager:
     def get_pending_requests(self) -> Dict[App, int]:
         '''Returns a dictionary with the number of pending requests (requests
         that are in the queue of some VM or are being executed) per app'''
-        res: Dict[App, int] = {}
+        res: Dict[App, int] = defaultdict(int)
         for vm in self.all_vms:
-            if vm.app in res.keys():
-                res[vm.app] += vm.get_pending_requests()
-            else:
-                res[vm.app] = vm.get_pending_requests()
+            res[vm.app] += vm.get_pending_requests()
 
         return res
 
@@ -627,6 +718,12 @@ class VmManager:
             ics: Sequence[InstanceClass], vm_count: Sequence[List[float]]):
         '''Selects the VMs that fulfill filter_fun and sets keep to true
         and the app to the app indicated in vm_count. It updates vm_count.'''
+        # Running VMs per instance class, in the same order as in
+        # running_vms_flat, so that each instance class only checks its VMs
+        running_vms_per_ic: Dict[InstanceClass, List[Vm]] = defaultdict(list)
+        for vm in self.running_vms_flat:
+            running_vms_per_ic[vm.ic].append(vm)
+
         for app_index, app in enumerate(apps):
             for ic_index, ic in enumerate(ics):
                 required_vms = int(vm_count[app_index][ic_index])
@@ -634,16 +731,17 @@ class VmManager:
                 # Keep up to required_vms
                 vms_to_keep = list(islice(
                     filter(lambda vm: filter_fun(vm, app, ic),
-                           self.running_vms_flat),
+                           running_vms_per_ic[ic]),
                     required_vms))
 
                 for vm in vms_to_keep:
                     vm.keep = True
 
                     # Check that the VM is not changing app if it has pending
-                    # requests
+                    # requests. A request started at this same instant after
+                    # a quantum ended is counted as executing, not in the queue
                     if vm.app is not None and vm.app != app and not vm.is_free():
-                        req_count = len(vm.store.items)
+                        req_count = len(vm.queue)
                         if vm.is_computing():
                             req_count += 1
                         print(f'WARNING: {vm.name()} repurposed for {app} but '
@@ -666,15 +764,19 @@ class VmManager:
                 vm.begin_shutdown()
                 vms_to_remove.append(vm)
 
-        # Step 2: actually remove them
-        for vm in vms_to_remove:
-            self.running_vms_flat.remove(vm)
-            self.shutdown_vms.append(vm)
+        # Step 2: actually remove them. The lists are rebuilt in one pass
+        # instead of searching each VM to remove in all of them
+        if not vms_to_remove:
+            return
+
+        removed = set(vms_to_remove)
+        self.running_vms_flat = [vm for vm in self.running_vms_flat
+                                 if vm not in removed]
+        self.shutdown_vms.extend(vms_to_remove)
 
-            for vms_for_ic in self.running_vms.values():
-                for vms in vms_for_ic.values():
-                    if vm in vms:
-                        vms.remove(vm)
+        for vms_for_ic in self.running_vms.values():
+            for ic, vms in vms_for_ic.items():
+                vms_for_ic[ic] = [vm for vm in vms if vm not in removed]
 
     def __launch_missing_vms(self, apps: Sequence[App],
             ics: Sequence[InstanceClass], vm_count: Sequence[List[float]]):
@@ -722,6 +824,12 @@ class MallooviaAllocator():
         self.request_sink = request_sink
         self.monitor = monitor
 
+        # Index of the allocation for each workload level. If a level were
+        # repeated, the first one is used, as list.index() would do
+        self.wl_level_indexes: Dict[Tuple, int] = {}
+        for index, wl_level in enumerate(allocation.workload_tuples):
+            self.wl_level_indexes.setdefault(wl_level, index)
+
         self.action = env.process(self.process())
 
     def __get_workload_level(self, ts: int):
@@ -731,7 +839,7 @@ class MallooviaAllocator():
     def __get_vm_count_copy(self, wl_level) -> Sequence[List[float]]:
         '''Gets the allocation values (vm count for each app) for this
         wl_level'''
-        index = self.allocation.workload_tuples.index(wl_level)
+        index = self.wl_level_indexes[wl_level]
         return tuple(list(x) for x in self.allocation.values[index])
 
     def __process_time_slot(self, ts: int):
@@ -3,11 +3,35 @@ Monitor.
 '''
 from enum import Enum
 import time
-from typing import List
+from typing import List, Tuple, Optional
 from dataclasses import dataclass
-import statistics
+from fractions import Fraction
+from itertools import chain
+import math
 import numpy as np
 
+def exact_mean(values: List[float]) -> float:
+    '''Returns the same mean as statistics.mean(), including its type: an int
+    if all the values are ints and the mean is integral, and the correctly
+    rounded float otherwise. statistics.mean() converts every value to a
+    fraction, which is very slow for millions of values. Here, the exact sum
+    is obtained as a few floats with repeated fsum() calls, each one adding
+    what the previous ones missed, and only those floats are converted to
+    fractions'''
+    count = len(values)
+    if all(type(v) is int for v in values):
+        mean = Fraction(sum(values), count)
+        return mean.numerator if mean.denominator == 1 else float(mean)
+
+    parts = [math.fsum(values)]
+    while True:
+        rest = math.fsum(chain(values, (-p for p in parts)))
+        if rest == 0:
+            break
+        parts.append(rest)
+
+    return float(sum(map(Fraction, parts)) / count)
+
 class EvType(Enum):
     '''Represents an event type'''
     VM_START=0
@@ -90,7 +114,7 @@ class Monitor():
         self.req_pending: int = 0
 
         self.response_times: List[float] = []
-        self.req_times: List = []
+        self.req_times: List[Tuple] = []
         self.vm_utils = {}
         self.events: List[str] = [] # List of events represented as strings
 
@@ -102,18 +126,27 @@ class Monitor():
         self.cost: float = 0
         self.util: float = 0 # Value between 0 and 1
 
+        # Response time stats computed by get_stats() and the number of
+        # processed requests they correspond to
+        self.resp_time_stats: Optional[Tuple[int, Tuple]] = None
+
     def add_req_injected(self, req):
         '''Adds an injected requests'''
         self.req_injected += 1
 
+    def add_reqs_injected(self, reqs):
+        '''Adds all the requests injected at the same time'''
+        self.req_injected += len(reqs)
+
     def add_req_proc(self, req):
         '''Adds a processed request and stores its statistics'''
         self.req_proc += 1
         resp_time = req.response_time
         self.response_times.append(resp_time)
 
-        self.req_times.append([req.num, req.creation_time, req.start_proc_time,
-                            req.end_proc_time, req.app, req.vm, req.lost])
+        # A tuple is a single allocation, smaller than a list
+        self.req_times.append((req.num, req.creation_time, req.start_proc_time,
+                               req.end_proc_time, req.app, req.vm, req.lost))
 
     def add_req_lost(self, req):
         '''Adds a lost request'''
@@ -141,6 +174,22 @@ class Monitor():
         self.util = current_util
         self.vm_utils = vm_utils
 
+    def __compute_resp_time_stats(self) -> Tuple:
+        '''Returns the mean, max, min, median, 90 and 95 percentiles of the
+        response times'''
+        count = len(self.response_times)
+        if count == 0:
+            return 0, 0, 0, 0, 0, 0
+
+        mean = exact_mean(self.response_times)
+        max_time = max(self.response_times)
+        min_time = min(self.response_times)
+        # Convert the response times to an array only once
+        median_time, perc90_time, perc95_time = np.percentile(
+            self.response_times, [50, 90, 95])
+
+        return mean, max_time, min_time, median_time, perc90_time, perc95_time
+
     def get_stats(self) -> SimulationStats:
         '''Obtain simulation statistics'''
         stats_start = time.time()
@@ -148,20 +197,12 @@ class Monitor():
         count = len(self.response_times)
         assert  count == self.req_proc
 
-        if count > 0:
-            mean = statistics.mean(self.response_times)
-            max_time = max(self.response_times)
-            min_time = min(self.response_times)
-            median_time = np.percentile(self.response_times, 50)
-            perc90_time = np.percentile(self.response_times, 90)
-            perc95_time = np.percentile(self.response_times, 95)
-        else:
-            mean = 0
-            max_time = 0
-            min_time = 0
-            median_time = 0
-            perc90_time = 0
-            perc95_time = 0
+        # Only recompute the response time stats if there are new requests
+        if self.resp_time_stats is None or self.resp_time_stats[0] != count:
+            self.resp_time_stats = (count, self.__compute_resp_time_stats())
+
+        (mean, max_time, min_time,
+            median_time, perc90_time, perc95_time) = self.resp_time_stats[1]
 
         stats_end = time.time()
 
@@ -192,6 +233,10 @@ class Monitor():
         '''Receives and event as a string and stores it'''
         self.events.append(ev)
 
+    def add_events(self, evs):
+        '''Receives a list of events as strings and stores them in order'''
+        self.events.extend(evs)
+
     def get_events(self) -> List[str]:
         '''Return the list of events'''
         return self.events
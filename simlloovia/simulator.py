@@ -3,13 +3,14 @@ simlloovia.
 '''
 from typing import Sequence, Tuple, Optional
 from functools import wraps
+import numpy as np
 import simpy
 
 from malloovia import (PerformanceSet, AllocationInfo, SolutionI, Workload,
-    TimeUnit, ReservedAllocation)
+    ReservedAllocation)
 
 from .core import (WorkloadInjector, LoadBalancer, VmManager, RequestSink,
-    MallooviaAllocator)
+    MallooviaAllocator, SEC_PER_TIME_UNIT)
 
 from .monitor import (Monitor, SimulationStats)
 
@@ -116,7 +117,7 @@ class Simulator():
         at the  beginning of the  time slot'''
 
         # Both the allocation and the workloads have the same period
-        period_sec = TimeUnit(solution.problem.workloads[0].time_unit).to('s')
+        period_sec = SEC_PER_TIME_UNIT[solution.problem.workloads[0].time_unit]
 
         return self.simulate(
             reserved_allocation=solution.reserved_allocation,
@@ -135,13 +136,23 @@ class Simulator():
         '''Reads a workload from a file of coma-separated-values file with all the
         workloads in the same line. The format of the file is something like:
                 3, 100, 34, 500
-        Returns the tuple with the values
+        Returns the tuple with the values. Raises ValueError if the line has
+        malformed values, if it is empty or if it has less than
+        workload_length values
         '''
         with open(filename) as f:
             row = f.readline()
-            result = (tuple(int(x) for x in row.split(',')[:workload_length]))
 
-        return result
+        # NumPy parses the whole line in C, which is much faster than int() for
+        # each value in long workloads. The line is stripped because NumPy
+        # parses a blank line or a trailing newline after a comma as 0
+        values = np.fromstring(row.strip(), dtype=np.int64, sep=',')
+        if values.size == 0:
+            raise ValueError(f'Workload file {filename} has no values')
+        if workload_length is not None and values.size < workload_length:
+            raise ValueError(f'Workload file {filename} has {values.size} values,'
+                             f' but the workload length is {workload_length}')
+        return tuple(values[:workload_length].tolist())
 
     def simulate_malloovia_workload_file(self, solution: SolutionI,
                 workload_filename_prefix: str,
@@ -162,7 +173,7 @@ class Simulator():
         be obtained by adding the app index to the `workload_filename_prefix`.
         '''
 
-        allocation_period_sec = TimeUnit(solution.problem.workloads[0].time_unit).to('s')
+        allocation_period_sec = SEC_PER_TIME_UNIT[solution.problem.workloads[0].time_unit]
 
         apps = [w.app for w in solution.problem.workloads]
         injector_workloads = []
@@ -214,7 +225,7 @@ class Simulator():
         trace.
         '''
 
-        allocation_period_sec = TimeUnit(solution.problem.workloads[0].time_unit).to('s')
+        allocation_period_sec = SEC_PER_TIME_UNIT[solution.problem.workloads[0].time_unit]
 
         apps = [w.app for w in solution.problem.workloads]
 
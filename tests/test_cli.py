@@ -1,6 +1,7 @@
 "Test the command line interface"
 import os
-import glob
+import shutil
+import tempfile
 import unittest
 
 from click.testing import CliRunner
@@ -15,38 +16,57 @@ class TestCliModule(unittest.TestCase):
     def test_cli_no_evs_no_utils(self):
         """Test that the command line works with a simple simulation"""
 
+        # Only the files created are checked, so a day is enough
         runner = CliRunner()
         result = runner.invoke(cli.simulate, ["--sol-file", "tests/sols/basic.p",
-            "--output-prefix", "clitest", "--output-dir", ".",
-            "--workload-length", "3600", "--quantum", "3600"])
+            "--output-prefix", "clitest", "--output-dir", self.out_dir,
+            "--workload-length", "24", "--quantum", "3600"])
 
         assert result.exit_code == 0
 
-        files = glob.glob("clitest*")
+        files = os.listdir(self.out_dir)
         assert 'clitest.csv' in files
         assert 'clitest_out.txt' in files
         assert 'clitest_reqs.csv' not in files
         assert 'clitest_utils.csv' not in files
 
+    def test_cli_stats_file(self):
+        """Test the response times written in the stats file"""
+
+        runner = CliRunner()
+        result = runner.invoke(cli.simulate, ["--sol-file", "tests/sols/basic.p",
+            "--output-prefix", "clitest", "--output-dir", self.out_dir,
+            "--workload-length", "24", "--quantum", "3600"])
+
+        assert result.exit_code == 0
+
+        with open(os.path.join(self.out_dir, 'clitest.csv')) as f:
+            lines = f.read().splitlines()
+
+        assert 'avg_resp_time,2400.0' in lines
+        assert 'max_resp_time,3600.0' in lines
+        assert 'min_resp_time,1200.0' in lines
+        assert 'median_resp_time,2400.0' in lines
+
     def test_cli_with_evs(self):
         """Test that the command line works with a simple simulation"""
 
         runner = CliRunner()
         runner.echo_stdin = True
         result = runner.invoke(cli.simulate, ["--sol-file", "tests/sols/basic.p",
-            "--output-prefix", "clitest", "--output-dir", ".",
+            "--output-prefix", "clitest", "--output-dir", self.out_dir,
             "--workload-length", "3600", "--quantum", "3600",
             "--save-evs", "true"])
 
         assert result.exit_code == 0
 
-        files = glob.glob("clitest*")
+        files = os.listdir(self.out_dir)
         assert 'clitest.csv' in files
         assert 'clitest_out.txt' in files
         assert 'clitest_reqs.csv' in files
         assert 'clitest_utils.csv' not in files
 
-        df = pd.read_csv('clitest_reqs.csv')
+        df = pd.read_csv(os.path.join(self.out_dir, 'clitest_reqs.csv'))
         assert len(df) == 10800
 
         req1_row = df.iloc[1]
@@ -65,20 +85,20 @@ class TestCliModule(unittest.TestCase):
         runner = CliRunner()
         runner.echo_stdin = True
         result = runner.invoke(cli.simulate, ["--sol-file", "tests/sols/basic.p",
-            "--output-prefix", "clitest", "--output-dir", ".",
+            "--output-prefix", "clitest", "--output-dir", self.out_dir,
             "--workload-length", "3600", "--quantum", "3600",
             "--save-utils", "true"])
 
         assert result.exit_code == 0
 
-        files = glob.glob("clitest*")
+        files = os.listdir(self.out_dir)
         assert 'clitest.csv' in files
         assert 'clitest_out.txt' in files
         assert 'clitest_evs.csv' not in files
         assert 'clitest_reqs.csv' not in files
         assert 'clitest_utils.csv' in files
 
-        df = pd.read_csv('clitest_utils.csv')
+        df = pd.read_csv(os.path.join(self.out_dir, 'clitest_utils.csv'))
         assert len(df) == 3600
 
         util0_row = df.iloc[0]
@@ -94,7 +114,8 @@ class TestCliModule(unittest.TestCase):
     def test_cli_with_config_file(self):
         runner = CliRunner()
         runner.echo_stdin = True
-        result = runner.invoke(cli.simulate, ["--config", "tests/config_test"])
+        result = runner.invoke(cli.simulate, ["--config", "tests/config_test",
+            "--output-dir", self.out_dir])
 
         assert result.exit_code == 0
 
@@ -105,15 +126,30 @@ class TestCliModule(unittest.TestCase):
         runner.echo_stdin = True
         result = runner.invoke(cli.simulate, ["--sol-file",
             "tests/sols/3vm.yaml", "--output-prefix", "clitest",
-            "--output-dir", ".", "--quantum", "3600"])
+            "--output-dir", self.out_dir, "--quantum", "3600"])
 
         assert result.exit_code == 0
 
+    def test_cli_workload_without_period(self):
+        """Test that a workload without period is rejected before creating
+        any output file"""
+
+        runner = CliRunner()
+        result = runner.invoke(cli.simulate, ["--sol-file", "tests/sols/basic.p",
+            "--output-prefix", "clitest", "--output-dir", self.out_dir,
+            "--workload", "tests/workloads/wl"])
+
+        assert result.exit_code == 2
+        assert "--workload-period" in result.output
+        assert not os.listdir(self.out_dir)
+
     def setUp(self):
         core.Vm.count = 0
         core.Request.count = 0
 
+        # Each test writes to its own directory, so that tests can run in
+        # parallel
+        self.out_dir = tempfile.mkdtemp(prefix="clitest")
+
     def tearDown(self):
-        files = glob.glob("clitest*")
-        for f in files:
-            os.remove(f)
+        shutil.rmtree(self.out_dir)
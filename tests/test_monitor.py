@@ -0,0 +1,31 @@
+"Test the statistics computed by the monitor"
+import statistics
+import unittest
+
+from simlloovia.monitor import exact_mean
+
+
+class TestExactMean(unittest.TestCase):
+    """Test that exact_mean() gives the same result as statistics.mean()"""
+
+    def assert_same_as_statistics(self, values):
+        expected = statistics.mean(values)
+        result = exact_mean(values)
+        self.assertEqual(type(result), type(expected))
+        self.assertEqual(repr(result), repr(expected))
+
+    def test_integral_mean_of_ints(self):
+        """The mean of ints is an int if it is integral"""
+        self.assert_same_as_statistics([1200, 2400, 3600])
+        self.assertIsInstance(exact_mean([1200, 2400, 3600]), int)
+
+    def test_non_integral_mean_of_ints(self):
+        self.assert_same_as_statistics([1200, 2400, 3601])
+
+    def test_floats(self):
+        self.assert_same_as_statistics([1200.0, 2400.0, 3600.0])
+        self.assert_same_as_statistics([0.1]*10 + [1e16, 1.0, -1e16])
+        self.assert_same_as_statistics([i/7 + 2800 for i in range(1000)])
+
+    def test_ints_and_floats(self):
+        self.assert_same_as_statistics([1200, 2400.5, 3600])
@@ -0,0 +1,53 @@
+"Test reading the workload files"
+import os
+import shutil
+import tempfile
+import unittest
+
+from simlloovia.simulator import Simulator
+
+
+class TestReadWorkload(unittest.TestCase):
+    """Test Simulator.read_workload()"""
+
+    def write_workload(self, row):
+        filename = os.path.join(self.wl_dir, 'wl0.csv')
+        with open(filename, 'w') as f:
+            f.write(row)
+        return filename
+
+    def test_values(self):
+        filename = self.write_workload(' 3, 100 , 34,500\n')
+        self.assertEqual(Simulator().read_workload(filename, None),
+                         (3, 100, 34, 500))
+        self.assertEqual(Simulator().read_workload(filename, 2), (3, 100))
+
+    def test_trailing_comma(self):
+        """A trailing comma doesn't add a value"""
+        for row in ['3,100,', '3,100,\n', '3,100, \n']:
+            filename = self.write_workload(row)
+            self.assertEqual(Simulator().read_workload(filename, None),
+                             (3, 100))
+
+    def test_malformed(self):
+        for row in ['3;100\n', '3,1.5,100\n', '3,,100\n', '3,a\n']:
+            filename = self.write_workload(row)
+            with self.assertRaises(ValueError):
+                Simulator().read_workload(filename, None)
+
+    def test_empty(self):
+        for row in ['', '\n', '  \n']:
+            filename = self.write_workload(row)
+            with self.assertRaises(ValueError):
+                Simulator().read_workload(filename, None)
+
+    def test_shorter_than_workload_length(self):
+        filename = self.write_workload('3,100,34\n')
+        with self.assertRaises(ValueError):
+            Simulator().read_workload(filename, 4)
+
+    def setUp(self):
+        self.wl_dir = tempfile.mkdtemp(prefix="wltest")
+
+    def tearDown(self):
+        shutil.rmtree(self.wl_dir)
@@ -1,3 +1,5 @@
+import contextlib
+import io
 import mock
 import unittest
 
@@ -10,6 +12,15 @@ from simlloovia.core import (Vm, Monitor, VmManager, RequestSink, LoadBalancer,
     Request)
 
 class Test_Vm(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # Creating an autospec inspects the whole class, so it is done once
+        # and the mocks are reset for each test
+        cls.monitor = mock.create_autospec(Monitor)
+        cls.request_sink = mock.create_autospec(RequestSink)
+        cls.load_balancer = mock.create_autospec(LoadBalancer)
+        cls.vm_manager = mock.create_autospec(VmManager)
+
     def __set_up(self, cores, app_perf):
         self.ic = InstanceClass(
             "ic", name="ic",
@@ -27,10 +38,10 @@ class Test_Vm(unittest.TestCase):
 
         self.env = simpy.Environment()
 
-        self.monitor = mock.create_autospec(Monitor)
-        self.request_sink = mock.create_autospec(RequestSink)
-        self.load_balancer = mock.create_autospec(LoadBalancer)
-        self.vm_manager = mock.create_autospec(VmManager)
+        self.monitor.reset_mock()
+        self.request_sink.reset_mock()
+        self.load_balancer.reset_mock()
+        self.vm_manager.reset_mock()
 
     def test_1_req_1_core_1_perf(self):
         self.__set_up(cores=1, app_perf=1)
@@ -161,3 +172,59 @@ class Test_Vm(unittest.TestCase):
         self.assertAlmostEqual(req2.response_time, 0.9)
         self.assertAlmostEqual(req3.response_time, 1)
         self.assertAlmostEqual(req4.response_time, 1)
+
+    def test_load_balancer_least_remaining_time(self):
+        self.__set_up(cores=1, app_perf=1)
+        load_balancer = LoadBalancer(self.env, request_sink=self.request_sink,
+            monitor=self.monitor)
+
+        vms = [Vm(self.env, ic=self.ic, perfs=self.perfs, out=self.request_sink,
+                  load_balancer=load_balancer, monitor=self.monitor,
+                  quantum_sec=0.1) for _ in range(2)]
+        for vm in vms:
+            vm.assign_app(self.app)
+
+        reqs = [Request(self.env, self.app) for _ in range(3)]
+        for req in reqs:
+            load_balancer.add_request(req)
+
+        self.env.run()
+
+        # In a tie, the first VM is chosen
+        self.assertEqual([req.vm for req in reqs], [vms[0], vms[1], vms[0]])
+        self.assertAlmostEqual(reqs[2].response_time, 2)
+
+    def test_shutdown_warnings_at_quantum_end(self):
+        """The request started when a quantum ends is reported as executing"""
+        self.__set_up(cores=1, app_perf=1)
+        vm = Vm(self.env, ic=self.ic, perfs=self.perfs, out=self.request_sink,
+            load_balancer=self.load_balancer, monitor=self.monitor,
+            quantum_sec=1)
+
+        vm.assign_app(self.app)
+
+        reqs = [Request(self.env, self.app) for _ in range(3)]
+        for req in reqs:
+            vm.add_request(req)
+
+        output = io.StringIO()
+
+        def shutdown():
+            # Same as the allocator: wait for the events at the end of the
+            # period and then shut down
+            yield self.env.timeout(1)
+            yield self.env.timeout(0)
+            with contextlib.redirect_stdout(output):
+                vm.begin_shutdown()
+
+        self.env.process(shutdown())
+        self.env.run()
+
+        self.assertEqual(output.getvalue().splitlines(), [
+            f'WARNING: shutting down VM {vm.name()}, which is still executing'
+            ' a request at time 1',
+            f'WARNING: shutting down VM {vm.name()} with 1 pending requests at'
+            ' time 1',
+        ])
+        self.assertEqual([req.response_time for req in reqs], [1, 2, 3])
+        self.assertEqual(vm.stop_time, 3)